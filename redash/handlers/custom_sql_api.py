@@ -1,51 +1,357 @@
+import gzip
+import hashlib
 import logging
 import traceback
+from operator import itemgetter
 from time import sleep
-from typing import Tuple, Dict, Any
 
+import brotli
 from rq import Connection
-from flask import request, jsonify
+from rq.job import Callback, JobStatus
+from flask import Response, request
 from flask_restful import Resource
+from redis.exceptions import LockError
+from sqlalchemy import bindparam
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext import baked
+import sqlparse
 
 from redash.security import csrf
 from redash.serializers import serialize_job
-from redash import models, rq_redis_connection
-from redash.tasks.queries.execution import enqueue_query
+from redash import models, redis_connection, rq_redis_connection, settings
+from redash.tasks.queries.execution import (
+    QueryExecutionError,
+    enqueue_query,
+    execute_query,
+    inline_result_key,
+    job_done_key,
+    notify_job_done,
+)
+from redash.utils import json_dumps
 
 logger = logging.getLogger(__name__)
 
+# 오류 응답 정의: 키 -> (직렬화된 JSON 응답 본문, HTTP 상태 코드)
+_ERR = {
+    key: (json_dumps({"status": "fail", "message": message}).encode(), http_status)
+    for key, (message, http_status) in {
+        "missing_fields": ("Request must include 'query' and 'db_name' fields.", 400),
+        "missing_query": ("Request must include 'query' fields.", 400),
+        "missing_db_name": ("Request must include 'db_name' fields.", 400),
+        "database_not_found": ("Database name not found.", 404),
+        "query_timeout": ("Query execution timeout.", 408),
+        "query_execution_failed": ("Query execution failed.", 500),
+        "sql_syntax_error": ("SQL syntax error.", 400),
+        "internal_server_error": ("Internal server error occurred. Please try again later.", 500),
+    }.items()
+}
+
+# 요청 필수 필드 추출 및 누락된 필드별 오류 키
+_get_required_fields = itemgetter("query", "db_name")
+_MISSING_FIELD_ERRORS = {"query": "missing_query", "db_name": "missing_db_name"}
+
+JOB_WAIT_TIMEOUT = 10   # 작업 완료를 기다리는 최대 시간(초)
+JOB_STATUS_RECHECK_COUNT = 20       # 완료 알림 후 작업 상태를 다시 확인하는 최대 횟수
+JOB_STATUS_RECHECK_INTERVAL = 0.05  # 작업 상태 재확인 간격(초)
+
+# 데이터 소스 캐시 설정 (DataSource 스키마가 바뀌면 버전을 올려 기존 캐시를 일괄 무효화)
+DATA_SOURCE_CACHE_VERSION = "v1"
+DATA_SOURCE_CACHE_TTL = 60      # 데이터 소스 이름 캐시의 만료 시간(초)
+
+# 쿼리 결과 응답 캐시 설정 (응답 형식이 바뀌면 버전을 올려 기존 캐시를 일괄 무효화)
+RESULT_CACHE_VERSION = "v1"
+RESULT_CACHE_TTL = 30           # 동일 쿼리 응답 캐시의 만료 시간(초)
+
+# 응답 압축 설정 (대화형 API이므로 압축률보다 지연 시간을 우선)
+COMPRESS_MIN_SIZE = 4096        # 이 크기(바이트)를 넘는 응답만 압축
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 5
+
+# 동일 쿼리 동시 요청 병합 설정
+COALESCE_LOCK_TTL = 15          # 쿼리를 대표로 실행하는 요청의 잠금 만료 시간(초)
+
+
+# 데이터 소스 이름 조회 쿼리는 한 번만 컴파일하여 재사용 (baked query)
+_bakery = baked.bakery()
+
+
+def _data_source_by_name(db_name: str):
+    """데이터베이스 이름으로 데이터 소스 모델을 DB에서 조회하는 함수"""
+    query = _bakery(lambda session: session.query(models.DataSource))
+    query += lambda q: q.filter(models.DataSource.name == bindparam("name"))
+    return query(models.db.session()).params(name=db_name).first()
+
+
+def _data_source_key(db_name: str) -> str:
+    """데이터 소스 이름 -> ID 캐시 키"""
+    return f"{DATA_SOURCE_CACHE_VERSION}:datasource:name:{db_name}"
+
+
+def _get_data_source_cached(db_name: str):
+    """데이터베이스 이름으로 데이터 소스 모델을 조회하는 함수
+    이름 -> ID 매핑을 Redis에 캐시하고, 모델은 기본 키로 조회한다.
+    :param db_name: 데이터베이스 이름
+    :return: 데이터 소스 모델 (없으면 None)
+    """
+    key = _data_source_key(db_name)
+    data_source_id = redis_connection.get(key)
+    if data_source_id is not None:
+        data_source = models.DataSource.query.get(int(data_source_id))
+        # 캐시된 이후 삭제되거나 이름이 바뀐 경우 다시 조회
+        if data_source is not None and data_source.name == db_name:
+            return data_source
+
+    data_source = _data_source_by_name(db_name)
+    if data_source is not None:
+        redis_connection.setex(key, DATA_SOURCE_CACHE_TTL, str(data_source.id))
+    return data_source
+
+
+def _request_digest(db_name: str, query_text: str) -> str:
+    """(데이터베이스 이름, 쿼리)를 식별하는 해시
+    gen_query_hash는 공백과 주석을 제거하므로 문자열 리터럴만 다른 쿼리도 같은 해시가 된다.
+    응답을 재사용하는 키이므로 요청에 담긴 쿼리 텍스트를 그대로 사용한다.
+    """
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(str(db_name).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(query_text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _writes_data(statement) -> bool:
+    """SELECT 구문 안에 데이터를 쓰는 부분이 있는지 확인하는 함수
+    SELECT ... INTO, 데이터를 변경하는 CTE(WITH d AS (DELETE ... RETURNING *) SELECT ...),
+    SELECT ... FOR UPDATE처럼 SELECT 외의 DML/DDL 키워드나 INTO가 있으면 True
+    """
+    for token in statement.flatten():
+        if token.ttype in sqlparse.tokens.Keyword.DML and token.normalized != "SELECT":
+            return True
+        if token.ttype in sqlparse.tokens.Keyword.DDL:
+            return True
+        if token.ttype is sqlparse.tokens.Keyword and token.normalized == "INTO":
+            return True
+    return False
+
+
+def _is_read_only(query_text: str) -> bool:
+    """쿼리의 모든 구문이 데이터를 읽기만 하는 SELECT인지 확인하는 함수
+    데이터를 변경하는 쿼리는 결과를 캐시하거나 다른 요청과 공유하지 않는다.
+    """
+    statements = [statement for statement in sqlparse.parse(query_text) if str(statement).strip()]
+    return bool(statements) and all(
+        statement.get_type() == "SELECT" and not _writes_data(statement) for statement in statements
+    )
+
+
+def _result_cache_key(digest: str) -> str:
+    """응답 본문 캐시 키"""
+    return f"{RESULT_CACHE_VERSION}:pubsql:{digest}"
+
+
+def _coalesce_lock_key(digest: str) -> str:
+    """같은 쿼리를 대표로 실행하는 요청의 잠금 키"""
+    return f"pubsql-lock:{digest}"
+
+
+def _coalesce_done_key(digest: str) -> str:
+    """대표 요청의 실행 완료 알림을 전달하는 Redis 리스트 키"""
+    return f"pubsql-done:{digest}"
+
+
+def _notify_waiters(done_key: str):
+    """대표 요청의 실행이 끝났음을 대기 중인 요청에 알리는 함수"""
+    pipe = redis_connection.pipeline()
+    pipe.rpush(done_key, 1)
+    pipe.expire(done_key, RESULT_CACHE_TTL)
+    pipe.execute()
+
+
+def _wait_for_shared_result(digest: str, timeout: int = JOB_WAIT_TIMEOUT):
+    """같은 쿼리를 실행 중인 대표 요청의 결과를 기다리는 함수
+    :param digest: 요청 해시
+    :param timeout: 최대 대기 시간(초)
+    :return: 캐시된 응답 본문 (대표 요청이 실패했거나 시간 초과 시 None)
+    """
+    done_key = _coalesce_done_key(digest)
+    if redis_connection.blpop(done_key, timeout=timeout) is None:
+        return None
+    # 같은 쿼리를 기다리는 다른 요청도 깨어날 수 있도록 알림을 다시 넣어 둔다
+    _notify_waiters(done_key)
+    return redis_connection.get(_result_cache_key(digest))
+
+
+def _job_done(job) -> bool:
+    """작업 상태를 새로 읽어 완료(성공/실패) 여부를 반환하는 함수"""
+    job.refresh()
+    return job.get_status(refresh=False) in (JobStatus.FINISHED, JobStatus.FAILED)
+
+
+def _wait_for_job(job, timeout: int = JOB_WAIT_TIMEOUT) -> bool:
+    """작업이 완료될 때까지 대기하는 함수
+    :param job: 대기할 RQ 작업
+    :param timeout: 최대 대기 시간(초)
+    :return: 제한 시간 내 작업 완료 여부
+    """
+    if job.success_callback is notify_job_done:
+        if rq_redis_connection.blpop(job_done_key(job.id), timeout=timeout) is None:
+            return False
+        # 같은 작업을 기다리는 다른 요청도 깨어날 수 있도록 완료 알림을 다시 넣어 둔다
+        notify_job_done(job, rq_redis_connection)
+        # RQ는 결과와 상태를 저장하기 전에 콜백을 호출하므로 상태가 반영될 때까지 잠시 확인
+        for _ in range(JOB_STATUS_RECHECK_COUNT):
+            if _job_done(job):
+                return True
+            sleep(JOB_STATUS_RECHECK_INTERVAL)
+        return False
+
+    # 다른 경로에서 콜백 없이 생성된 작업(동일 쿼리 중복 실행)은 알림이 오지 않으므로 상태를 확인
+    for _ in range(timeout):
+        if _job_done(job):
+            return True
+        sleep(1)
+    return False
+
 
 class PublicSQLExecutionResource(Resource):
     """
     사용자가 제공한 쿼리를 실행하고 결과를 반환하는 API 엔드포인트
     """
-    # 오류 메시지 정의
-    error_messages = {
-        "missing_fields": "Request must include 'query' and 'db_name' fields.",
-        "missing_query": "Request must include 'query' fields.",
-        "missing_db_name": "Request must include 'db_name' fields.",
-        "database_not_found": "Database name not found.",
-        "query_timeout": "Query execution timeout.",
-        "query_execution_failed": "Query execution failed.",
-        "sql_syntax_error": "SQL syntax error.",
-        "internal_server_error": "Internal server error occurred. Please try again later.",
-    }
-
-    def error_response(self, message: str, http_status: int) -> Tuple[Dict[str, Any], int]:
+    def error_response(self, error_key: str) -> Response:
         """오류 응답 생성하는 메서드
-        :param message: 오류 메시지
-        :param http_status: HTTP 상태 코드
+        미리 직렬화한 본문을 사용하므로 요청마다 JSON 인코딩을 하지 않는다.
+        응답 객체는 after_request 처리 중 헤더가 바뀔 수 있으므로 요청마다 새로 만든다.
+        :param error_key: 오류 키 (_ERR 참고)
         :return: 오류 응답
         """
-        return jsonify({"status": "fail", "message": message}), http_status
+        body, http_status = _ERR[error_key]
+        return Response(body, status=http_status, mimetype="application/json")
+
+    def success_response(self, body: bytes) -> Response:
+        """성공 응답 생성하는 메서드
+        본문으로 ETag를 만들고, 요청의 If-None-Match와 일치하면 304를 반환한다.
+        압축하는 경우 인코딩마다 다른 ETag가 되도록 인코딩 이름을 붙인다.
+        :param body: 직렬화된 JSON 응답 본문
+        :return: 성공 응답
+        """
+        response = Response(body, status=200, mimetype="application/json")
+        response.vary.add("Accept-Encoding")
+        response.add_etag()
+        encoding = self.negotiate_encoding(response.get_data())
+        if encoding is not None:
+            etag, _ = response.get_etag()
+            response.set_etag(f"{etag}-{encoding}")
+
+        etag, _ = response.get_etag()
+        if request.if_none_match.contains(etag):
+            not_modified = Response(status=304, headers={"ETag": response.headers["ETag"]})
+            not_modified.vary.add("Accept-Encoding")
+            return not_modified
+
+        if encoding is not None:
+            self.compress_response(response, encoding)
+        return response
+
+    def negotiate_encoding(self, body: bytes):
+        """응답 본문에 사용할 압축 방식을 정하는 메서드
+        :param body: 응답 본문
+        :return: 클라이언트가 지원하는 압축 방식(br, gzip), 압축하지 않으면 None
+        """
+        if len(body) <= COMPRESS_MIN_SIZE:
+            return None
+        accept_encodings = request.accept_encodings
+        if accept_encodings["br"]:
+            return "br"
+        if accept_encodings["gzip"]:
+            return "gzip"
+        return None
+
+    def compress_response(self, response: Response, encoding: str):
+        """응답 본문을 주어진 방식(brotli, gzip)으로 압축하는 메서드
+        :param response: 압축할 응답
+        :param encoding: 압축 방식 (negotiate_encoding 참고)
+        """
+        body = response.get_data()
+        if encoding == "br":
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+
+    def execute(self, query_text: str, db_name: str, digest: str = None) -> Response:
+        """쿼리를 실행하고 결과 응답을 반환하는 메서드
+        digest가 주어지면 성공한 응답 본문을 다른 요청이 재사용할 수 있도록 캐시한다.
+        :param query_text: 실행할 쿼리 텍스트
+        :param db_name: 데이터베이스 이름
+        :param digest: 요청 해시 (_request_digest 참고, 캐시하지 않는 쿼리는 None)
+        :return: 쿼리 실행 결과 응답
+        """
+        # 데이터베이스 이름으로 데이터 소스 모델 검색 (Redis 캐시 사용)
+        data_source = _get_data_source_cached(db_name)
+
+        # 데이터 소스가 없는 경우(데이터베이스 이름이 잘못된 경우)
+        if not data_source:
+            return self.error_response("database_not_found")
+
+        if settings.PUBLIC_SQL_SYNC_EXECUTION:
+            # 대기열을 거치지 않고 현재 프로세스에서 바로 실행 (실패 시 QueryExecutionError를 반환)
+            query_result_id = execute_query(query_text, data_source.id, {})
+            inline_result = None
+        else:
+            # 쿼리 실행 작업을 대기열에 추가
+            with Connection(rq_redis_connection):
+                job = enqueue_query(
+                    query=query_text,           # 쿼리 텍스트
+                    data_source=data_source,    # 데이터 소스 모델
+                    user_id=None,               # 사용자 ID는 없어도 됨
+                    is_api_key=False,           # API 키 사용 여부는 False
+                    scheduled_query=None,       # scheduled_query는 해당되지 않음
+                    on_success=Callback(notify_job_done),   # 작업 완료 알림
+                    on_failure=Callback(notify_job_done),
+                    inline_result=True,         # 작은 결과는 짧은 TTL의 별도 키에 JSON으로 저장
+                )
+
+            # 작업 완료 알림을 기다림 (최대 JOB_WAIT_TIMEOUT초)
+            completed = _wait_for_job(job)
+            if logger.isEnabledFor(logging.INFO):    # INFO 로그가 꺼져 있으면 직렬화 생략
+                logger.info("Job: %s", serialize_job(job))
+
+            # 작업이 완료되지 않은 경우
+            if not completed:
+                return self.error_response("query_timeout")
+            query_result_id = job.result
+            # 작업 실행 시 저장된 작은 결과(JSON)가 있으면 DB 조회와 재직렬화 없이 사용
+            inline_result = rq_redis_connection.get(inline_result_key(job.id))
+
+        # 쿼리 실행이 실패한 경우
+        if query_result_id is None or isinstance(query_result_id, QueryExecutionError):
+            return self.error_response("query_execution_failed")
+
+        if inline_result is not None:
+            body = b'{"status": "success", "result": ' + inline_result + b"}"
+        else:
+            # 쿼리 결과 조회 (QueryResult 모델에서 데이터 필드)
+            query_result = models.QueryResult.query.get(query_result_id)
+            if not query_result:
+                return self.error_response("query_execution_failed")
+            # 컬럼 형식(columnar)으로 저장된 결과는 "rows" 대신 "data"에 있음
+            data = query_result.data
+            result = data["rows"] if "rows" in data else data["data"]
+            body = json_dumps({"status": "success", "result": result}).encode()
+
+        if digest is not None:
+            redis_connection.setex(_result_cache_key(digest), RESULT_CACHE_TTL, body)
+        return self.success_response(body)
 
     @csrf.exempt    # CSRF 보호 비활성화
-    def post(self):
+    def post(self, org_slug=None):
         """POST 요청을 처리하고 쿼리를 실행하여 결과를 반환
+        :param org_slug: 조직 슬러그 (MULTI_ORG 사용 시 URL에서 전달되며 사용하지 않음)
         :request body: JSON 형식의 요청 데이터
             - query: 실행할 쿼리 텍스트 (필수)
             - db_name: 데이터베이스 이름 (필수) - redash에 등록된 데이터 소스 이름
+        :request header: Cache-Control: no-cache - 캐시된 결과를 사용하지 않고 쿼리를 다시 실행
         :return: 쿼리 실행 결과
             - status: 성공 또는 실패
             - result: 쿼리 실행 결과 (성공 시)
@@ -55,58 +361,51 @@ class PublicSQLExecutionResource(Resource):
             query_data = request.get_json()     # 요청 데이터 가져오기
             # 요청에 'query' 및 'db_name' 필드가 포함되어 있는지 확인
             if not query_data:
-                return self.error_response(self.error_messages["missing_fields"], 400)
-            if "query" not in query_data:
-                return self.error_response(self.error_messages["missing_query"], 400)
-            if "db_name" not in query_data:
-                return self.error_response(self.error_messages["missing_db_name"], 400)
-            query_text = query_data.get("query")
-            db_name = query_data.get("db_name")
-
-            # 데이터베이스 이름으로 데이터 소스 모델 검색
-            data_source = models.DataSource.query.filter(
-                models.DataSource.name == db_name,
-            ).first()   # 데이터 소스 모델 검색
-
-            # 데이터 소스가 없는 경우(데이터베이스 이름이 잘못된 경우)
-            if not data_source:
-                return self.error_response(self.error_messages["database_not_found"], 404)
+                return self.error_response("missing_fields")
+            try:
+                query_text, db_name = _get_required_fields(query_data)
+            except KeyError as e:
+                return self.error_response(_MISSING_FIELD_ERRORS[e.args[0]])
+            except TypeError:
+                return self.error_response("missing_fields")
 
-            # 쿼리 실행 작업을 대기열에 추가
-            with Connection(rq_redis_connection):
-                job = enqueue_query(
-                    query=query_text,           # 쿼리 텍스트
-                    data_source=data_source,    # 데이터 소스 모델
-                    user_id=None,               # 사용자 ID는 없어도 됨
-                    is_api_key=False,           # API 키 사용 여부는 False
-                    scheduled_query=None,       # scheduled_query는 해당되지 않음
-                )
+            # 데이터를 변경하는 쿼리는 캐시와 중복 요청 공유 없이 매번 실행
+            if not _is_read_only(query_text):
+                return self.execute(query_text, db_name)
 
-            # 작업이 완료될 때까지 대기 (최대 10회)
-            try_count = 0
-            while job.result is None and try_count < 10:
-                try_count += 1
-                sleep(1)
-                job.refresh()
-            logger.info("Job: %s", serialize_job(job))
+            # 최근에 같은 쿼리를 실행한 결과가 캐시에 있으면 바로 반환 (no-cache 요청은 제외)
+            digest = _request_digest(db_name, query_text)
+            if not request.cache_control.no_cache:
+                cached = redis_connection.get(_result_cache_key(digest))
+                if cached is not None:
+                    return self.success_response(cached)
 
-            # 작업이 완료되지 않은 경우
-            if job.result is None:
-                return self.error_response(self.error_messages["query_timeout"], 408)
+            # 같은 쿼리를 동시에 요청한 경우 하나의 요청만 실행하고 나머지는 그 결과를 공유
+            # (토큰을 확인하는 잠금이므로 만료 후 다른 요청이 얻은 잠금을 해제하지 않음)
+            lock = redis_connection.lock(_coalesce_lock_key(digest), timeout=COALESCE_LOCK_TTL)
+            if lock.acquire(blocking=False):
+                done_key = _coalesce_done_key(digest)
+                redis_connection.delete(done_key)   # 이전 실행의 알림 제거
+                try:
+                    return self.execute(query_text, db_name, digest)
+                finally:
+                    _notify_waiters(done_key)
+                    try:
+                        lock.release()
+                    except LockError:
+                        logger.warning("Coalescing lock for %s expired before the query finished.", digest)
 
-            # 쿼리 결과를 반환 (QueryResult 모델에서 데이터 필드)
-            query_result_id = job.result
-            query_result = models.QueryResult.query.get(query_result_id)
-            if query_result:
-                return jsonify({"status": "success", "result": query_result.data["rows"]}), 200
-            else:
-                return self.error_response(self.error_messages["query_execution_failed"], 500)
+            body = _wait_for_shared_result(digest, JOB_WAIT_TIMEOUT)
+            if body is not None:
+                return self.success_response(body)
+            # 대표 요청이 실패했거나 시간 초과된 경우 직접 실행
+            return self.execute(query_text, db_name, digest)
 
         # SQL 구문 오류
         except ProgrammingError as e:
             logger.error("SQL syntax error: %s\n%s", e, traceback.format_exc())
-            return self.error_response(self.error_messages["sql_syntax_error"], 400)
+            return self.error_response("sql_syntax_error")
         # 기타 오류
         except Exception as e:
             logger.error("Internal server error: %s\n%s", e, traceback.format_exc())
-            return self.error_response(self.error_messages["internal_server_error"], 500)
+            return self.error_response("internal_server_error")
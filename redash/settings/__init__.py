@@ -208,6 +208,9 @@ ADHOC_QUERY_TIME_LIMIT = int(os.environ.get("REDASH_ADHOC_QUERY_TIME_LIMIT", -1)
 
 JOB_EXPIRY_TIME = int(os.environ.get("REDASH_JOB_EXPIRY_TIME", 3600 * 12))
 JOB_DEFAULT_FAILURE_TTL = int(os.environ.get("REDASH_JOB_DEFAULT_FAILURE_TTL", 7 * 24 * 60 * 60))
+# Run queries of the public SQL execution API (/api/sqls/execution) inline in the web process instead of
+# enqueueing them. Inline queries are not subject to RQ job time limits, so enable it only for fast data sources.
+PUBLIC_SQL_SYNC_EXECUTION = parse_boolean(os.environ.get("REDASH_PUBLIC_SQL_SYNC_EXECUTION", "false"))
 
 LOG_LEVEL = os.environ.get("REDASH_LOG_LEVEL", "INFO")
 LOG_STDOUT = parse_boolean(os.environ.get("REDASH_LOG_STDOUT", "false"))
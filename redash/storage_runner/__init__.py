@@ -1,11 +1,19 @@
 import logging
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from itertools import chain, islice
+from types import MappingProxyType
 
 from redash.query_runner import BaseQueryRunner
 from redash.utils import json_loads
 
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 기본적으로 지원하는 데이터 유형
 TYPE_STRING = "string"
 TYPE_DATE = "date"
@@ -13,6 +21,46 @@ TYPE_INTEGER = "integer"
 
 SUPPORTED_STORAGE_COLUMN_TYPES = {TYPE_STRING, TYPE_DATE, TYPE_INTEGER}
 
+# 스토리지 객체 목록: 객체별 dict 대신 속성별 리스트로 저장 (열 단위 배치)
+ObjectsBatch = namedtuple("ObjectsBatch", ["names", "last_modified", "sizes", "etags"])
+
+OBJECTS_CHUNK_SIZE = 1000   # list_objects가 한 번에 반환하는 최대 객체 수
+MAX_ROWS = 100000           # run_query 결과의 최대 행 수
+
+
+def loads_query(query):
+    """
+    쿼리(JSON 문자열)를 파싱하는 함수. orjson이 설치되어 있으면 orjson으로 파싱하고,
+    orjson이 처리하지 못하는 입력은 json_loads로 다시 파싱합니다.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(query)
+        except orjson.JSONDecodeError:
+            pass
+    return json_loads(query)
+
+
+def take_rows(rows, limit=MAX_ROWS):
+    """
+    행 이터러블에서 최대 limit개의 행을 가져오는 함수.
+    limit개보다 많은 행이 있는지 확인하기 위해 한 행을 더 읽고, (행 리스트, 잘림 여부)를 반환합니다.
+    """
+    rows = list(islice(rows, limit + 1))
+    truncated = len(rows) > limit
+    if truncated:
+        del rows[limit:]
+    return rows, truncated
+
+
+def mark_truncated(result, limit, bucket_name):
+    """
+    결과가 limit개에서 잘렸음을 경고 로그로 남기고 결과에 truncated 플래그를 추가하는 함수.
+    """
+    logger.warning("Query result for bucket %s truncated to %d rows.", bucket_name, limit)
+    result["truncated"] = True
+    return result
+
 
 class BaseStorageRunner(BaseQueryRunner, ABC):
     """
@@ -20,6 +68,18 @@ class BaseStorageRunner(BaseQueryRunner, ABC):
     S3, MinIO, Azure Blob 등의 스토리지와 연동하기 위한 부모 클래스로 사용됩니다.
     """
 
+    # 스토리지 러너 식별자: 하위 클래스에서 지정합니다.
+    TYPE = None
+    NAME = None
+
+    @classmethod
+    def type(cls):
+        return cls.TYPE
+
+    @classmethod
+    def name(cls):
+        return cls.NAME
+
     def __init__(self, configuration):
         super().__init__(configuration)
 
@@ -27,6 +87,7 @@ class BaseStorageRunner(BaseQueryRunner, ABC):
     def list_objects(self, bucket_name=None):
         """
         스토리지에서 파일 목록을 조회하는 메소드. 각 스토리지에 맞게 구현해야 합니다.
+        전체 목록을 메모리에 올리지 않도록 최대 OBJECTS_CHUNK_SIZE개씩 ObjectsBatch를 yield합니다.
         """
         pass
 
@@ -58,12 +119,20 @@ class BaseStorageRunner(BaseQueryRunner, ABC):
             "required": ["endpoint", "access_key", "secret_key", "bucket"],
         }
 
+    def _probe(self):
+        """
+        연결 테스트에 사용하는 가벼운 요청. 기본적으로 list_objects의 첫 번째 묶음만 조회하며,
+        스토리지에 더 가벼운 확인 방법이 있으면 재정의합니다.
+        """
+        return bool(next(iter(self.list_objects()), True))
+
     def test_connection(self):
         """
-        스토리지와의 연결을 테스트하는 메소드. 각 스토리지에 맞게 list_objects 메소드를 통해 구현됩니다.
+        스토리지와의 연결을 테스트하는 메소드. _probe 메소드를 통해 확인합니다.
         """
         try:
-            self.list_objects()
+            if not self._probe():
+                raise Exception(f"Bucket {self.configuration.get('bucket')} does not exist")
             return True
         except Exception as e:
             logger.exception("Failed to connect to the storage: %s", e)
@@ -74,31 +143,41 @@ class BaseStorageRunner(BaseQueryRunner, ABC):
         쿼리 실행 메소드: 기본적으로 query는 버킷에서 객체 목록을 가져오는 명령이라고 가정합니다.
         """
         try:
-            query_params = json_loads(query)
+            query_params = loads_query(query)
             bucket_name = query_params.get("bucket", self.configuration.get("bucket"))
             objects = self.list_objects(bucket_name)
             columns = [{"name": "object_name", "type": TYPE_STRING}, {"name": "last_modified", "type": TYPE_DATE}]
-            rows = [{"object_name": obj["name"], "last_modified": obj["last_modified"]} for obj in objects]
-
-            return {"columns": columns, "rows": rows}, None
+            rows, truncated = take_rows(
+                {"object_name": name, "last_modified": last_modified}
+                for name, last_modified in chain.from_iterable(
+                    zip(batch.names, batch.last_modified) for batch in objects
+                )
+            )
+
+            result = {"columns": columns, "rows": rows}
+            if truncated:
+                mark_truncated(result, MAX_ROWS, bucket_name)
+            return result, None
         except Exception as e:
             return None, str(e)
 
 
-storage_runners = {}
+# 등록된 스토리지 러너: 등록은 _storage_runners에 하고, 외부에는 읽기 전용 뷰만 공개
+# (뷰는 원본 dict를 그대로 반영하므로 import 시점에 가져가도 이후 등록 내용이 보임)
+_storage_runners = {}
+storage_runners = MappingProxyType(_storage_runners)
 
 
 def register_storage(storage_runner_class):
-    global storage_runners
     if storage_runner_class.enabled():
-        storage_runners[storage_runner_class.type()] = storage_runner_class
+        _storage_runners[storage_runner_class.TYPE] = storage_runner_class
         logger.debug(
             "Registering %s (%s) storage runner.",
-            storage_runner_class.name(),
-            storage_runner_class.type(),
+            storage_runner_class.NAME,
+            storage_runner_class.TYPE,
         )
     else:
         logger.debug(
             "%s storage runner enabled but not supported, not registering.",
-            storage_runner_class.name(),
+            storage_runner_class.NAME,
         )
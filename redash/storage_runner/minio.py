@@ -1,7 +1,18 @@
 import logging
-
-from redash.utils import json_loads
-from redash.storage_runner import BaseStorageRunner, register_storage
+from functools import lru_cache
+from itertools import chain, islice
+from operator import attrgetter
+
+from redash.storage_runner import (
+    MAX_ROWS,
+    OBJECTS_CHUNK_SIZE,
+    BaseStorageRunner,
+    ObjectsBatch,
+    loads_query,
+    mark_truncated,
+    register_storage,
+    take_rows,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,46 +23,60 @@ try:
 except ImportError:
     enabled = False
 
+# run_query 결과 형식 (쿼리의 output_format 값)
+OUTPUT_FORMAT_ROWS = "rows"           # 행 단위 dict 리스트 (기본값, Redash UI 호환)
+OUTPUT_FORMAT_COLUMNAR = "columnar"   # 컬럼별 리스트
+
+# MinIO 객체에서 ObjectsBatch 필드 순서대로 속성을 추출
+_object_fields = attrgetter("object_name", "last_modified", "size", "etag")
+
+
+@lru_cache(maxsize=32)
+def _get_minio_client(endpoint, access_key, secret_key, secure, region):
+    """
+    접속 정보별로 Minio 클라이언트를 공유하는 팩토리.
+    캐시 키에는 해시 가능한 원시 값만 사용하며, 클라이언트의 커넥션 풀을 러너 인스턴스 간에 재사용합니다.
+    """
+    return Minio(
+        endpoint,
+        access_key=access_key,
+        secret_key=secret_key,
+        secure=secure,
+        region=region,
+    )
+
 
 class MinioRunner(BaseStorageRunner):
+    TYPE = "minio"
+    NAME = "MinIO"
+
     @classmethod
     def enabled(cls):
         return enabled
 
-    @classmethod
-    def name(cls):
-        return "MinIO"
-
-    @classmethod
-    def type(cls):
-        return "minio"
-
     def __init__(self, configuration):
         super().__init__(configuration)
-        self.client = Minio(
+        self.client = _get_minio_client(
             configuration["endpoint"],
-            access_key=configuration["access_key"],
-            secret_key=configuration["secret_key"],
-            secure=configuration.get("secure", False),
-            region=configuration.get("region", None),
+            configuration["access_key"],
+            configuration["secret_key"],
+            bool(configuration.get("secure", False)),
+            configuration.get("region", None),
         )
 
-    def list_objects(self, bucket_name=None):
+    def list_objects(self, bucket_name=None, chunk_size=OBJECTS_CHUNK_SIZE):
         """
         MinIO 버킷에서 파일 목록을 가져오는 메소드.
+        최대 chunk_size개씩 ObjectsBatch로 yield하며, 소비한 만큼만 MinIO에서 조회합니다.
         """
         bucket_name = bucket_name or self.configuration.get("bucket")
         try:
-            objects = self.client.list_objects(bucket_name)
-            return [
-                {
-                    "name": obj.object_name,
-                    "last_modified": obj.last_modified,
-                    "size": obj.size,
-                    "etag": obj.etag
-                }
-                for obj in objects
-            ]
+            objects = map(_object_fields, self.client.list_objects(bucket_name))
+            while True:
+                chunk = list(islice(objects, chunk_size))
+                if not chunk:
+                    break
+                yield ObjectsBatch(*map(list, zip(*chunk)))
         except Exception as e:
             logger.error("Failed to list objects from bucket %s: %s", bucket_name, str(e))
             raise Exception(f"Failed to list objects from bucket {bucket_name}: {e}")
@@ -74,24 +99,37 @@ class MinioRunner(BaseStorageRunner):
             logger.error("Failed to retrieve metadata for object %s: %s", object_name, str(e))
             raise Exception(f"Failed to retrieve metadata for object {object_name}: {e}")
 
-    def test_connection(self):
+    def _probe(self):
         """
-        MinIO 연결 테스트를 수행하는 메소드.
-        기본적으로 버킷에서 객체 목록을 조회해봄으로써 연결을 확인합니다.
+        버킷 존재 여부만 확인하는 메소드. 객체 목록을 조회하지 않습니다.
         """
-        try:
-            self.list_objects()
-            return True
-        except Exception as e:
-            logger.error("MinIO connection test failed: %s", str(e))
-            raise Exception("MinIO connection test failed: " + str(e))
+        return self.client.bucket_exists(self.configuration.get("bucket"))
+
+    @staticmethod
+    def _columnar_data(objects, limit=MAX_ROWS):
+        """
+        ObjectsBatch 묶음을 행 단위 dict로 풀지 않고 컬럼별 리스트로 이어 붙이는 메소드.
+        (컬럼 데이터, 잘림 여부)를 반환합니다.
+        """
+        data = {"object_name": [], "last_modified": [], "size": [], "etag": []}
+        remaining = limit
+        for batch in objects:
+            if remaining <= 0:
+                return data, True
+            for values, batch_values in zip(data.values(), batch):
+                values.extend(batch_values[:remaining])
+            if len(batch.names) > remaining:
+                return data, True
+            remaining -= len(batch.names)
+        return data, False
 
     def run_query(self, query, user):
         """
         주어진 쿼리에 따라 MinIO에서 객체 목록을 조회하는 메소드.
+        쿼리 예: {"bucket": "test", "output_format": "columnar"} (output_format 기본값은 "rows")
         """
         try:
-            query_params = json_loads(query)
+            query_params = loads_query(query)
             bucket_name = query_params.get("bucket", self.configuration.get("bucket"))
             objects = self.list_objects(bucket_name)
             columns = [
@@ -100,9 +138,22 @@ class MinioRunner(BaseStorageRunner):
                 {"name": "size", "type": "integer"},
                 {"name": "etag", "type": "string"}
             ]
-            rows = [{"object_name": obj["name"], "last_modified": obj["last_modified"], "size": obj["size"], "etag": obj["etag"]} for obj in objects]
-
-            return {"columns": columns, "rows": rows}, None
+            if query_params.get("output_format", OUTPUT_FORMAT_ROWS) == OUTPUT_FORMAT_COLUMNAR:
+                data, truncated = self._columnar_data(objects, MAX_ROWS)
+                result = {"columns": columns, "data": data}
+            else:
+                rows, truncated = take_rows(
+                    (
+                        {"object_name": name, "last_modified": last_modified, "size": size, "etag": etag}
+                        for name, last_modified, size, etag in chain.from_iterable(zip(*batch) for batch in objects)
+                    ),
+                    MAX_ROWS,
+                )
+                result = {"columns": columns, "rows": rows}
+
+            if truncated:
+                mark_truncated(result, MAX_ROWS, bucket_name)
+            return result, None
         except Exception as e:
             logger.error("Failed to run query: %s", str(e))
             return None, str(e)
@@ -137,7 +188,10 @@ if __name__ == "__main__":
     try:
         objects = runner.list_objects()
         # DataFrame으로 변환
-        df_objects = pd.DataFrame(objects)
+        df_objects = pd.DataFrame(
+            [row for batch in objects for row in zip(*batch)],
+            columns=ObjectsBatch._fields,
+        )
         print("\nObjects in bucket:")
         print(df_objects)
     except Exception as e:
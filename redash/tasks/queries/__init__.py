@@ -1,4 +1,10 @@
-from .execution import enqueue_query, execute_query
+from .execution import (
+    enqueue_query,
+    execute_query,
+    inline_result_key,
+    job_done_key,
+    notify_job_done,
+)
 from .maintenance import (
     cleanup_query_results,
     empty_schedules,
@@ -15,11 +15,21 @@ from redash.query_runner import InterruptException
 from redash.tasks.alerts import check_alerts_for_query
 from redash.tasks.failure_report import track_failure
 from redash.tasks.worker import Job, Queue
-from redash.utils import gen_query_hash, utcnow
+from redash.utils import gen_query_hash, json_dumps, utcnow
 from redash.worker import get_job_logger
 
 logger = get_job_logger(__name__)
 TIMEOUT_MESSAGE = "Query exceeded Redash query execution time limit."
+# Maximum in-memory size (as measured by _get_size_iterative) of a result kept under
+# inline_result_key for jobs enqueued with inline_result=True.
+INLINE_RESULT_MAX_SIZE = 256 * 1024
+# Expiry of inline results; callers read them right after the job finishes, and the
+# QueryResult stored in the database remains the durable copy.
+INLINE_RESULT_TTL = 60
+# Expiry of the completion signal pushed by notify_job_done.
+JOB_DONE_TTL = 60
+# When RQ and Redash share a Redis server, new jobs are written in the same transaction as their lock.
+SHARED_REDIS = settings.RQ_REDIS_URL == settings._REDIS_URL
 
 
 def _job_lock_id(query_hash, data_source_id):
@@ -30,7 +40,38 @@ def _unlock(query_hash, data_source_id):
     redis_connection.delete(_job_lock_id(query_hash, data_source_id))
 
 
-def enqueue_query(query, data_source, user_id, is_api_key=False, scheduled_query=None, metadata={}):
+def job_done_key(job_id):
+    return "job-done:%s" % job_id
+
+
+def inline_result_key(job_id):
+    return "job-inline-result:%s" % job_id
+
+
+def notify_job_done(job, connection, *args, **kwargs):
+    """RQ success/failure callback that wakes up callers blocked (BLPOP) on ``job_done_key(job.id)``.
+
+    RQ runs callbacks before it stores the job's result and final status, so waiters must
+    not assume the job is finished the moment they are woken up.
+    """
+    key = job_done_key(job.id)
+    pipe = connection.pipeline()
+    pipe.rpush(key, job.id)
+    pipe.expire(key, JOB_DONE_TTL)
+    pipe.execute()
+
+
+def enqueue_query(
+    query,
+    data_source,
+    user_id,
+    is_api_key=False,
+    scheduled_query=None,
+    metadata={},
+    on_success=None,
+    on_failure=None,
+    inline_result=False,
+):
     query_hash = gen_query_hash(query)
     logger.info("Inserting job for %s with metadata=%s", query_hash, metadata)
     try_count = 0
@@ -71,8 +112,6 @@ def enqueue_query(query, data_source, user_id, is_api_key=False, scheduled_query
                     job = None
 
             if not job:
-                pipe.multi()
-
                 if scheduled_query:
                     queue_name = data_source.scheduled_queue_name
                     scheduled_query_id = scheduled_query.id
@@ -96,24 +135,41 @@ def enqueue_query(query, data_source, user_id, is_api_key=False, scheduled_query
                         "scheduled": scheduled_query_id is not None,
                         "query_id": metadata.get("query_id"),
                         "user_id": user_id,
+                        "inline_result": inline_result,
                     },
                 }
 
                 if not scheduled_query:
                     enqueue_kwargs["result_ttl"] = settings.JOB_EXPIRY_TIME
 
+                if on_success is not None:
+                    enqueue_kwargs["on_success"] = on_success
+                if on_failure is not None:
+                    enqueue_kwargs["on_failure"] = on_failure
+
+                if SHARED_REDIS:
+                    # Job hash, queue push and lock go out in a single MULTI/EXEC round trip, and a
+                    # concurrent lock change discards the job instead of leaving a duplicate enqueued.
+                    # RQ expects a pipeline that is still in WATCH mode and starts the MULTI block itself.
+                    enqueue_kwargs["pipeline"] = pipe
+                else:
+                    pipe.multi()
+
                 job = queue.enqueue(execute_query, query, data_source.id, metadata, **enqueue_kwargs)
 
-                logger.info("[%s] Created new job: %s", query_hash, job.id)
                 pipe.set(
                     _job_lock_id(query_hash, data_source.id),
                     job.id,
                     settings.JOB_EXPIRY_TIME,
                 )
                 pipe.execute()
+                logger.info("[%s] Created new job: %s", query_hash, job.id)
             break
 
         except redis.WatchError:
+            if SHARED_REDIS:
+                # The job was discarded along with the transaction.
+                job = None
             continue
         finally:
             pipe.reset()
@@ -196,7 +252,8 @@ class QueryExecutor:
             models.scheduled_queries_executions.update(self.query_model.id)
 
     def run(self):
-        if threading.current_thread() == threading.main_thread():
+        # Inline (job-less) execution runs inside the web process, which manages its own signals.
+        if self.job is not None and threading.current_thread() == threading.main_thread():
             signal.signal(signal.SIGINT, signal_handler)
 
         started_at = time.time()
@@ -218,12 +275,13 @@ class QueryExecutor:
             logger.warning("Unexpected error while running query:", exc_info=1)
 
         run_time = time.time() - started_at
+        data_size = _get_size_iterative(data) if data is not None else None
 
         logger.info(
             "job=execute_query query_hash=%s ds_id=%d data_length=%s error=[%s]",
             self.query_hash,
             self.data_source_id,
-            data and _get_size_iterative(data),
+            data_size,
             error,
         )
 
@@ -233,7 +291,10 @@ class QueryExecutor:
         if self.data_source is None:
             logger.error("Data source is None. Data Source ID: %s", self.data_source_id)
 
-        _unlock(self.query_hash, self.data_source.id)
+        # The query_hash lock belongs to an enqueued job; an inline run never took it, and deleting it
+        # would let a duplicate of a job still in the queue be enqueued.
+        if self.job is not None:
+            _unlock(self.query_hash, self.data_source.id)
 
         if error is not None and data is None:
             result = QueryExecutionError(error)
@@ -261,6 +322,7 @@ class QueryExecutor:
             updated_query_ids = models.Query.update_latest_result(query_result)
 
             models.db.session.commit()
+            self._attach_inline_result(data, data_size)
             self._log_progress("checking_alerts")
             for query_id in updated_query_ids:
                 check_alerts_for_query.delay(query_id, self.metadata)
@@ -270,8 +332,23 @@ class QueryExecutor:
             models.db.session.commit()
             return result
 
+    def _attach_inline_result(self, data, data_size):
+        # Small results are stored as JSON under a short-lived key next to the job so callers can
+        # skip loading the QueryResult. They are not kept in job.meta, which lives as long as the job.
+        # data_size is the size already measured in run(), so oversized results are never serialized.
+        if self.job is None or self.job.meta.get("inline_result") is not True:
+            return
+        if data_size is None or data_size > INLINE_RESULT_MAX_SIZE:
+            return
+
+        rows = data["rows"] if "rows" in data else data.get("data")
+        if rows is None:
+            return
+
+        self.job.connection.setex(inline_result_key(self.job.id), INLINE_RESULT_TTL, json_dumps(rows))
+
     def _annotate_query(self, query_runner):
-        self.metadata["Job ID"] = self.job.id
+        self.metadata["Job ID"] = self.job.id if self.job else None
         self.metadata["Query Hash"] = self.query_hash
         self.metadata["Scheduled"] = self.is_scheduled_query
 
@@ -285,7 +362,7 @@ class QueryExecutor:
             self.query_hash,
             self.data_source.type,
             self.data_source.id,
-            self.job.id,
+            self.job.id if self.job else None,
             self.metadata.get("Queue", "unknown"),
             self.metadata.get("query_id", "unknown"),
             self.metadata.get("Username", "unknown"),
@@ -0,0 +1,477 @@
+import gzip
+import threading
+import uuid
+from unittest import TestCase
+
+import brotli
+from mock import Mock, patch
+from rq.job import JobStatus
+
+from redash import models, redis_connection, rq_redis_connection
+from redash.handlers.custom_sql_api import (
+    COMPRESS_MIN_SIZE,
+    _coalesce_done_key,
+    _coalesce_lock_key,
+    _data_source_key,
+    _get_data_source_cached,
+    _is_read_only,
+    _notify_waiters,
+    _request_digest,
+    _result_cache_key,
+    _wait_for_job,
+)
+from redash.tasks.queries.execution import (
+    QueryExecutionError,
+    inline_result_key,
+    job_done_key,
+    notify_job_done,
+)
+from redash.utils import json_dumps, json_loads
+from tests import BaseTestCase
+
+
+def mock_job(statuses, success_callback=notify_job_done, **kwargs):
+    # get_status가 statuses를 차례로 반환하고, 마지막 상태를 계속 유지하는 mock 작업
+    statuses = list(statuses)
+    job = Mock(id=uuid.uuid4().hex, success_callback=success_callback, **kwargs)
+    job.get_status.side_effect = lambda refresh=True: statuses.pop(0) if len(statuses) > 1 else statuses[0]
+    return job
+
+
+def finished_job(rows=None, result=1):
+    # 완료된 작업 mock (rows가 주어지면 작업 실행 시 저장되는 작은 결과로 저장)
+    job = Mock(id=uuid.uuid4().hex, result=result)
+    if rows is not None:
+        rq_redis_connection.setex(inline_result_key(job.id), 60, json_dumps(rows))
+    return job
+
+
+class TestWaitForJob(TestCase):
+    def tearDown(self):
+        rq_redis_connection.flushdb()
+
+    def test_returns_when_notified(self):
+        job = mock_job([JobStatus.FINISHED])
+        notify_job_done(job, rq_redis_connection)
+
+        self.assertTrue(_wait_for_job(job, timeout=1))
+        # 같은 작업을 기다리는 다른 요청을 위해 완료 알림이 다시 들어 있음
+        self.assertEqual(1, rq_redis_connection.llen(job_done_key(job.id)))
+
+    @patch("redash.handlers.custom_sql_api.sleep")
+    def test_rechecks_status_written_after_callback(self, sleep):
+        # RQ는 콜백을 호출한 뒤에 FINISHED 상태를 저장함
+        job = mock_job([JobStatus.STARTED, JobStatus.STARTED, JobStatus.FINISHED])
+        notify_job_done(job, rq_redis_connection)
+
+        self.assertTrue(_wait_for_job(job, timeout=1))
+        self.assertEqual(3, job.refresh.call_count)
+        self.assertEqual(2, sleep.call_count)
+
+    @patch("redash.handlers.custom_sql_api.sleep")
+    def test_gives_up_if_status_is_never_written(self, sleep):
+        job = mock_job([JobStatus.STARTED])
+        notify_job_done(job, rq_redis_connection)
+
+        self.assertFalse(_wait_for_job(job, timeout=1))
+
+    def test_times_out_without_notification(self):
+        job = mock_job([JobStatus.STARTED])
+
+        self.assertFalse(_wait_for_job(job, timeout=1))
+        job.refresh.assert_not_called()
+
+    @patch("redash.handlers.custom_sql_api.sleep")
+    def test_polls_jobs_without_callback(self, sleep):
+        job = mock_job([JobStatus.STARTED, JobStatus.FAILED], success_callback=None)
+
+        self.assertTrue(_wait_for_job(job, timeout=5))
+        self.assertEqual(1, sleep.call_count)
+
+    @patch("redash.handlers.custom_sql_api.sleep")
+    def test_polling_times_out(self, sleep):
+        job = mock_job([JobStatus.STARTED], success_callback=None)
+
+        self.assertFalse(_wait_for_job(job, timeout=3))
+        self.assertEqual(3, sleep.call_count)
+
+
+class PublicSQLExecutionTestCase(BaseTestCase):
+    def post_sql(self, query="SELECT 1", db_name=None, headers=None):
+        data = {"query": query, "db_name": db_name or self.factory.data_source.name}
+        return self.client.post(
+            "/{}/api/sqls/execution".format(self.factory.org.slug),
+            data=json_dumps(data),
+            content_type="application/json",
+            headers=headers,
+        )
+
+
+@patch("redash.handlers.custom_sql_api._wait_for_job", return_value=True)
+@patch("redash.handlers.custom_sql_api.enqueue_query")
+class TestPublicSQLExecution(PublicSQLExecutionTestCase):
+    def test_returns_inline_result(self, enqueue_query, _):
+        enqueue_query.return_value = finished_job([{"a": 1}])
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual({"status": "success", "result": [{"a": 1}]}, rv.json)
+        _, kwargs = enqueue_query.call_args
+        self.assertIs(notify_job_done, kwargs["on_success"].func)
+
+    def test_org_scoped_url(self, enqueue_query, _):
+        # MULTI_ORG에서는 add_org_resource가 org_slug를 URL 인자로 전달함
+        enqueue_query.return_value = finished_job([{"a": 1}])
+
+        rv = self.client.post(
+            "/{}/api/sqls/execution".format(self.factory.org.slug),
+            data=json_dumps({"query": "SELECT 1", "db_name": self.factory.data_source.name}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{"a": 1}], rv.json["result"])
+
+    def test_returns_rows_from_query_result(self, enqueue_query, _):
+        query_result = self.factory.create_query_result(data={"columns": [], "rows": [{"b": 2}]})
+        enqueue_query.return_value = finished_job(result=query_result.id)
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{"b": 2}], rv.json["result"])
+
+    def test_timeout(self, enqueue_query, wait_for_job):
+        enqueue_query.return_value = finished_job(result=None)
+        wait_for_job.return_value = False
+
+        rv = self.post_sql()
+
+        self.assertEqual(408, rv.status_code)
+
+    def test_failed_job(self, enqueue_query, _):
+        enqueue_query.return_value = finished_job(result=None)
+
+        rv = self.post_sql()
+
+        self.assertEqual(500, rv.status_code)
+        self.assertEqual("fail", rv.json["status"])
+
+    def test_missing_fields(self, enqueue_query, _):
+        rv = self.client.post(
+            "/{}/api/sqls/execution".format(self.factory.org.slug),
+            data=json_dumps({"query": "SELECT 1"}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(400, rv.status_code)
+        self.assertEqual("Request must include 'db_name' fields.", rv.json["message"])
+        enqueue_query.assert_not_called()
+
+    def test_unknown_data_source(self, enqueue_query, _):
+        rv = self.post_sql(db_name="no such database")
+
+        self.assertEqual(404, rv.status_code)
+        enqueue_query.assert_not_called()
+
+
+class TestGetDataSourceCached(BaseTestCase):
+    def test_caches_data_source_id(self):
+        data_source = self.factory.data_source
+
+        self.assertEqual(data_source, _get_data_source_cached(data_source.name))
+        self.assertEqual(str(data_source.id), redis_connection.get(_data_source_key(data_source.name)))
+
+        with patch("redash.handlers.custom_sql_api._data_source_by_name") as by_name:
+            self.assertEqual(data_source, _get_data_source_cached(data_source.name))
+        by_name.assert_not_called()
+
+    def test_ignores_stale_entry_after_rename(self):
+        data_source = self.factory.data_source
+        old_name = data_source.name
+        _get_data_source_cached(old_name)
+
+        data_source.name = "renamed"
+        models.db.session.commit()
+
+        self.assertIsNone(_get_data_source_cached(old_name))
+        self.assertEqual(data_source, _get_data_source_cached("renamed"))
+
+    def test_unknown_name_is_not_cached(self):
+        self.assertIsNone(_get_data_source_cached("no such database"))
+        self.assertIsNone(redis_connection.get(_data_source_key("no such database")))
+
+
+class TestRequestDigest(TestCase):
+    def test_distinguishes_queries_that_normalize_alike(self):
+        # 공백이나 주석 표시만 다른 문자열 리터럴도 서로 다른 요청으로 구분
+        self.assertNotEqual(
+            _request_digest("db", "SELECT * FROM t WHERE name = 'John Smith'"),
+            _request_digest("db", "SELECT * FROM t WHERE name = 'JohnSmith'"),
+        )
+        self.assertNotEqual(_request_digest("db", "SELECT '/* a */'"), _request_digest("db", "SELECT ''"))
+
+    def test_distinguishes_databases(self):
+        self.assertNotEqual(_request_digest("a", "b|SELECT 1"), _request_digest("a|b", "SELECT 1"))
+        self.assertEqual(_request_digest("db", "SELECT 1"), _request_digest("db", "SELECT 1"))
+
+
+class TestIsReadOnly(TestCase):
+    def test_select(self):
+        self.assertTrue(_is_read_only("SELECT 1"))
+        self.assertTrue(_is_read_only("SELECT 1; SELECT 2;\n"))
+        self.assertTrue(_is_read_only("WITH t AS (SELECT 1) SELECT * FROM t"))
+
+    def test_modifying_statements(self):
+        self.assertFalse(_is_read_only("INSERT INTO t VALUES (1)"))
+        self.assertFalse(_is_read_only("SELECT 1; DELETE FROM t"))
+        self.assertFalse(_is_read_only("UPDATE t SET a = 1"))
+
+    def test_select_into(self):
+        self.assertFalse(_is_read_only("SELECT a INTO new_table FROM t"))
+
+    def test_data_modifying_cte(self):
+        self.assertFalse(_is_read_only("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d"))
+        self.assertFalse(_is_read_only("WITH i AS (INSERT INTO t VALUES (1) RETURNING id) SELECT id FROM i"))
+        self.assertFalse(_is_read_only("WITH u AS (UPDATE t SET a = 1 RETURNING *) SELECT 1"))
+
+    def test_locking_select(self):
+        self.assertFalse(_is_read_only("SELECT * FROM t FOR UPDATE"))
+
+    def test_keywords_in_string_literals(self):
+        self.assertTrue(_is_read_only("SELECT 'DELETE INTO' FROM t -- drop"))
+
+    def test_empty_query(self):
+        self.assertFalse(_is_read_only(""))
+
+
+@patch("redash.handlers.custom_sql_api._wait_for_job", return_value=True)
+@patch("redash.handlers.custom_sql_api.enqueue_query")
+class TestPublicSQLExecutionCache(PublicSQLExecutionTestCase):
+    def cache_key(self, query="SELECT 1"):
+        return _result_cache_key(_request_digest(self.factory.data_source.name, query))
+
+    def test_cache_miss_stores_response(self, enqueue_query, _):
+        enqueue_query.return_value = finished_job([{"a": 1}])
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        enqueue_query.assert_called_once()
+        self.assertEqual(rv.json, json_loads(redis_connection.get(self.cache_key())))
+
+    def test_cache_hit(self, enqueue_query, _):
+        redis_connection.set(self.cache_key(), json_dumps({"status": "success", "result": [{"a": 2}]}))
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{"a": 2}], rv.json["result"])
+        enqueue_query.assert_not_called()
+
+    def test_if_none_match(self, enqueue_query, _):
+        redis_connection.set(self.cache_key(), json_dumps({"status": "success", "result": [{"a": 2}]}))
+        etag = self.post_sql().headers["ETag"]
+
+        rv = self.post_sql(headers={"If-None-Match": etag})
+
+        self.assertEqual(304, rv.status_code)
+        self.assertEqual(b"", rv.data)
+        self.assertEqual(etag, rv.headers["ETag"])
+
+    def test_no_cache_bypasses_cached_response(self, enqueue_query, _):
+        redis_connection.set(self.cache_key(), json_dumps({"status": "success", "result": [{"a": 2}]}))
+        enqueue_query.return_value = finished_job([{"a": 3}])
+
+        rv = self.post_sql(headers={"Cache-Control": "no-cache"})
+
+        self.assertEqual([{"a": 3}], rv.json["result"])
+        enqueue_query.assert_called_once()
+        # 새로 실행한 결과로 캐시를 갱신
+        self.assertEqual(rv.json, json_loads(redis_connection.get(self.cache_key())))
+
+    def test_modifying_query_is_not_cached(self, enqueue_query, _):
+        query = "INSERT INTO t VALUES (1)"
+        redis_connection.set(self.cache_key(query), json_dumps({"status": "success", "result": []}))
+        enqueue_query.return_value = finished_job([])
+
+        self.post_sql(query)
+        self.post_sql(query)
+
+        self.assertEqual(2, enqueue_query.call_count)
+
+
+@patch("redash.handlers.custom_sql_api._wait_for_job", return_value=True)
+@patch("redash.handlers.custom_sql_api.enqueue_query")
+class TestPublicSQLExecutionCoalescing(PublicSQLExecutionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.digest = _request_digest(self.factory.data_source.name, "SELECT 1")
+        self.lock_key = _coalesce_lock_key(self.digest)
+        self.done_key = _coalesce_done_key(self.digest)
+
+    def hold_lock(self):
+        # 다른 요청이 같은 쿼리를 실행 중인 상태
+        lock = redis_connection.lock(self.lock_key, timeout=60)
+        self.assertTrue(lock.acquire(blocking=False))
+        return lock
+
+    def test_holder_executes_and_notifies_waiters(self, enqueue_query, _):
+        enqueue_query.return_value = finished_job([{"a": 1}])
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        enqueue_query.assert_called_once()
+        self.assertIsNone(redis_connection.get(self.lock_key))
+        self.assertEqual(1, redis_connection.llen(self.done_key))
+
+    def test_holder_does_not_release_lock_taken_over_after_expiry(self, enqueue_query, _):
+        def expire_and_take_over(*args, **kwargs):
+            # 실행이 잠금 만료 시간보다 오래 걸려 다른 요청이 잠금을 얻은 경우
+            redis_connection.delete(self.lock_key)
+            redis_connection.set(self.lock_key, "other-token")
+            return finished_job([{"a": 1}])
+
+        enqueue_query.side_effect = expire_and_take_over
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual("other-token", redis_connection.get(self.lock_key))
+
+    def test_waiter_receives_shared_body(self, enqueue_query, _):
+        self.hold_lock()
+
+        def finish_holder():
+            redis_connection.set(
+                _result_cache_key(self.digest), json_dumps({"status": "success", "result": [{"a": 2}]})
+            )
+            _notify_waiters(self.done_key)
+
+        timer = threading.Timer(0.2, finish_holder)
+        timer.start()
+        try:
+            rv = self.post_sql()
+        finally:
+            timer.join()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{"a": 2}], rv.json["result"])
+        enqueue_query.assert_not_called()
+
+    def test_waiter_executes_after_holder_fails(self, enqueue_query, _):
+        self.hold_lock()
+        # 대표 요청이 결과를 캐시하지 못하고 완료 알림만 보낸 경우
+        _notify_waiters(self.done_key)
+        enqueue_query.return_value = finished_job([{"a": 3}])
+
+        rv = self.post_sql()
+
+        self.assertEqual([{"a": 3}], rv.json["result"])
+        enqueue_query.assert_called_once()
+
+    def test_waiter_executes_after_timeout(self, enqueue_query, _):
+        lock = self.hold_lock()
+        enqueue_query.return_value = finished_job([{"a": 4}])
+
+        with patch("redash.handlers.custom_sql_api.JOB_WAIT_TIMEOUT", 1):
+            rv = self.post_sql()
+
+        self.assertEqual([{"a": 4}], rv.json["result"])
+        enqueue_query.assert_called_once()
+        # 대기한 요청은 다른 요청의 잠금을 해제하지 않음
+        self.assertTrue(lock.owned())
+
+
+@patch("redash.handlers.custom_sql_api.settings.PUBLIC_SQL_SYNC_EXECUTION", True)
+@patch("redash.handlers.custom_sql_api.enqueue_query")
+@patch("redash.handlers.custom_sql_api.execute_query")
+class TestPublicSQLSyncExecution(PublicSQLExecutionTestCase):
+    def test_executes_inline(self, execute_query, enqueue_query):
+        query_result = self.factory.create_query_result(data={"columns": [], "rows": [{"a": 5}]})
+        execute_query.return_value = query_result.id
+
+        rv = self.post_sql()
+
+        self.assertEqual(200, rv.status_code)
+        self.assertEqual([{"a": 5}], rv.json["result"])
+        execute_query.assert_called_once_with("SELECT 1", self.factory.data_source.id, {})
+        enqueue_query.assert_not_called()
+
+    def test_query_error(self, execute_query, enqueue_query):
+        # execute_query는 실패를 예외로 던지지 않고 QueryExecutionError를 반환
+        execute_query.return_value = QueryExecutionError("boom")
+
+        rv = self.post_sql()
+
+        self.assertEqual(500, rv.status_code)
+        self.assertEqual("Query execution failed.", rv.json["message"])
+        enqueue_query.assert_not_called()
+
+
+class TestPublicSQLExecutionCompression(PublicSQLExecutionTestCase):
+    def cache_result(self, size):
+        body = json_dumps({"status": "success", "result": ["x" * size]})
+        digest = _request_digest(self.factory.data_source.name, "SELECT 1")
+        redis_connection.set(_result_cache_key(digest), body)
+        return body.encode()
+
+    def test_small_response_is_not_compressed(self):
+        self.cache_result(10)
+
+        rv = self.post_sql(headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(200, rv.status_code)
+        self.assertNotIn("Content-Encoding", rv.headers)
+        self.assertIn("Accept-Encoding", rv.vary)
+
+    def test_gzip(self):
+        body = self.cache_result(COMPRESS_MIN_SIZE)
+
+        rv = self.post_sql(headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual("gzip", rv.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", rv.vary)
+        self.assertEqual(body, gzip.decompress(rv.data))
+        self.assertEqual(len(rv.data), int(rv.headers["Content-Length"]))
+
+    def test_brotli_is_preferred(self):
+        body = self.cache_result(COMPRESS_MIN_SIZE)
+
+        rv = self.post_sql(headers={"Accept-Encoding": "gzip, br"})
+
+        self.assertEqual("br", rv.headers["Content-Encoding"])
+        self.assertEqual(body, brotli.decompress(rv.data))
+        self.assertLess(len(rv.data), len(body))
+
+    def test_not_compressed_without_accept_encoding(self):
+        body = self.cache_result(COMPRESS_MIN_SIZE)
+
+        rv = self.post_sql(headers={"Accept-Encoding": "identity"})
+
+        self.assertNotIn("Content-Encoding", rv.headers)
+        self.assertEqual(body, rv.data)
+
+    def test_etag_differs_per_encoding(self):
+        self.cache_result(COMPRESS_MIN_SIZE)
+
+        identity = self.post_sql(headers={"Accept-Encoding": "identity"})
+        gzipped = self.post_sql(headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotEqual(identity.headers["ETag"], gzipped.headers["ETag"])
+        # 압축하지 않은 응답의 ETag로는 압축된 응답에 대해 304를 받지 않음
+        rv = self.post_sql(headers={"Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]})
+        self.assertEqual(200, rv.status_code)
+
+    def test_not_modified_compressed(self):
+        self.cache_result(COMPRESS_MIN_SIZE)
+        etag = self.post_sql(headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+        rv = self.post_sql(headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+        self.assertEqual(304, rv.status_code)
+        self.assertEqual(etag, rv.headers["ETag"])
+        self.assertIn("Accept-Encoding", rv.vary)
+        self.assertNotIn("Content-Encoding", rv.headers)
@@ -1,8 +1,23 @@
+import inspect
+from itertools import count
 from unittest import TestCase
 
 import mock
 
-from redash.storage_runner.minio import MinioRunner
+from redash.storage_runner import (
+    OBJECTS_CHUNK_SIZE,
+    BaseStorageRunner,
+    ObjectsBatch,
+    storage_runners,
+)
+from redash.storage_runner.minio import MinioRunner, _get_minio_client
+
+
+def infinite_objects(pulled):
+    # 끝없이 객체를 반환하는 MinIO 목록 (pulled에 가져간 개수를 기록)
+    for i in count():
+        pulled.append(i)
+        yield mock.Mock(object_name="file%d.txt" % i, last_modified="2023-09-09", size=i, etag="etag%d" % i)
 
 
 class TestMinioRunner(TestCase):
@@ -11,7 +26,8 @@ class TestMinioRunner(TestCase):
         # Mock Minio client
         self.mock_client = mock.Mock()
         MockMinio.return_value = self.mock_client
-        
+        _get_minio_client.cache_clear()
+
         # MinioRunner 인스턴스 생성
         self.config = {
             "endpoint": "mock.endpoint",
@@ -23,6 +39,12 @@ class TestMinioRunner(TestCase):
         }
         self.runner = MinioRunner(self.config)
 
+    def test_registered(self):
+        # 앱 시작 시 MinIO 러너가 타입 이름으로 등록됨
+        self.assertIs(storage_runners["minio"], MinioRunner)
+        self.assertEqual(MinioRunner.type(), "minio")
+        self.assertEqual(MinioRunner.name(), "MinIO")
+
     def test_list_objects(self):
         # Minio에서 반환할 mock 객체 목록 설정
         mock_objects = [
@@ -33,15 +55,50 @@ class TestMinioRunner(TestCase):
 
         # list_objects 메소드 호출
         result = self.runner.list_objects()
+        self.assertTrue(inspect.isgenerator(result))
+        self.mock_client.list_objects.assert_not_called()
 
         # 예상되는 결과
-        expected = [
-            {"name": "file1.txt", "last_modified": "2023-09-09", "size": 123, "etag": "etag1"},
-            {"name": "file2.txt", "last_modified": "2023-09-10", "size": 456, "etag": "etag2"},
+        expected = ObjectsBatch(
+            names=["file1.txt", "file2.txt"],
+            last_modified=["2023-09-09", "2023-09-10"],
+            sizes=[123, 456],
+            etags=["etag1", "etag2"],
+        )
+
+        self.assertEqual(list(result), [expected])
+        self.mock_client.list_objects.assert_called_once_with("mock_bucket")
+
+    def test_list_objects_chunked(self):
+        # chunk_size 단위로 나누어 반환
+        mock_objects = [
+            mock.Mock(object_name="file%d.txt" % i, last_modified="2023-09-09", size=i, etag="etag%d" % i)
+            for i in range(5)
         ]
+        self.mock_client.list_objects.return_value = iter(mock_objects)
 
-        self.assertEqual(result, expected)
-        self.mock_client.list_objects.assert_called_once_with("test")
+        result = list(self.runner.list_objects(chunk_size=2))
+
+        self.assertEqual([len(batch.names) for batch in result], [2, 2, 1])
+        self.assertEqual(result[-1].names, ["file4.txt"])
+
+    def test_list_objects_empty(self):
+        # 빈 버킷인 경우 아무것도 반환하지 않음
+        self.mock_client.list_objects.return_value = []
+
+        result = self.runner.list_objects()
+
+        self.assertEqual(list(result), [])
+
+    @mock.patch("redash.storage_runner.minio.Minio")
+    def test_client_is_shared_between_runners(self, MockMinio):
+        # 같은 접속 정보를 사용하는 러너는 Minio 클라이언트를 재사용
+        first = MinioRunner(self.config)
+        second = MinioRunner(dict(self.config))
+
+        self.assertIs(first.client, second.client)
+        self.assertIs(first.client, self.runner.client)
+        MockMinio.assert_not_called()
 
     def test_get_metadata(self):
         # Minio에서 반환할 mock 메타데이터 설정
@@ -67,7 +124,7 @@ class TestMinioRunner(TestCase):
         }
 
         self.assertEqual(result, expected)
-        self.mock_client.stat_object.assert_called_once_with("test", "file1.txt")
+        self.mock_client.stat_object.assert_called_once_with("mock_bucket", "file1.txt")
 
     def test_run_query(self):
         # Minio에서 반환할 mock 객체 목록 설정
@@ -97,15 +154,103 @@ class TestMinioRunner(TestCase):
         self.assertIsNone(error)
         self.mock_client.list_objects.assert_called_once_with("test")
 
+    def test_run_query_columnar(self):
+        # 쿼리의 output_format이 columnar인 경우 컬럼별 리스트로 반환
+        mock_objects = [
+            mock.Mock(object_name="file1.txt", last_modified="2023-09-09", size=123, etag="etag1"),
+            mock.Mock(object_name="file2.txt", last_modified="2023-09-10", size=456, etag="etag2"),
+        ]
+        self.mock_client.list_objects.return_value = mock_objects
+
+        result, error = self.runner.run_query('{"bucket": "test", "output_format": "columnar"}', user=None)
+
+        self.assertIsNone(error)
+        self.assertNotIn("rows", result)
+        self.assertNotIn("truncated", result)
+        self.assertEqual(
+            result["data"],
+            {
+                "object_name": ["file1.txt", "file2.txt"],
+                "last_modified": ["2023-09-09", "2023-09-10"],
+                "size": [123, 456],
+                "etag": ["etag1", "etag2"],
+            },
+        )
+
+    def test_run_query_stops_at_max_rows(self):
+        # 결과 행 수 제한에 도달하면 더 이상 목록을 가져오지 않음
+        pulled = []
+        self.mock_client.list_objects.return_value = infinite_objects(pulled)
+
+        with mock.patch("redash.storage_runner.minio.MAX_ROWS", 3):
+            result, error = self.runner.run_query('{"bucket": "test"}', user=None)
+
+        self.assertIsNone(error)
+        self.assertEqual([row["object_name"] for row in result["rows"]], ["file0.txt", "file1.txt", "file2.txt"])
+        self.assertTrue(result["truncated"])
+        self.assertEqual(len(pulled), OBJECTS_CHUNK_SIZE)
+
+    def test_run_query_not_truncated_at_exact_max_rows(self):
+        # 결과가 정확히 제한 행 수인 경우에는 잘리지 않은 것으로 처리
+        self.mock_client.list_objects.return_value = [
+            mock.Mock(object_name="file%d.txt" % i, last_modified="2023-09-09", size=i, etag="etag%d" % i)
+            for i in range(3)
+        ]
+
+        with mock.patch("redash.storage_runner.minio.MAX_ROWS", 3):
+            result, error = self.runner.run_query('{"bucket": "test"}', user=None)
+
+        self.assertIsNone(error)
+        self.assertEqual(len(result["rows"]), 3)
+        self.assertNotIn("truncated", result)
+
+    def test_run_query_columnar_stops_at_max_rows(self):
+        # 컬럼 형식에서도 제한 행 수에서 자르고 truncated 플래그를 추가
+        pulled = []
+        self.mock_client.list_objects.return_value = infinite_objects(pulled)
+
+        with mock.patch("redash.storage_runner.minio.MAX_ROWS", 3):
+            result, error = self.runner.run_query('{"bucket": "test", "output_format": "columnar"}', user=None)
+
+        self.assertIsNone(error)
+        self.assertEqual(result["data"]["object_name"], ["file0.txt", "file1.txt", "file2.txt"])
+        self.assertTrue(result["truncated"])
+        self.assertEqual(len(pulled), OBJECTS_CHUNK_SIZE)
+
+    def test_default_probe_reads_first_chunk_only(self):
+        # 기본 _probe는 첫 번째 묶음만 조회하고 목록 전체를 소비하지 않음
+        pulled = []
+        self.mock_client.list_objects.return_value = infinite_objects(pulled)
+
+        self.assertTrue(BaseStorageRunner._probe(self.runner))
+        self.assertEqual(len(pulled), OBJECTS_CHUNK_SIZE)
+
+    def test_test_connection_does_not_list_objects(self):
+        pulled = []
+        self.mock_client.list_objects.return_value = infinite_objects(pulled)
+        self.mock_client.bucket_exists.return_value = True
+
+        self.assertTrue(self.runner.test_connection())
+        self.assertEqual(pulled, [])
+
     def test_test_connection_success(self):
-        # list_objects 호출 성공 시 테스트
-        self.mock_client.list_objects.return_value = []
+        # 버킷 존재 여부만 확인하고 객체 목록은 조회하지 않음
+        self.mock_client.bucket_exists.return_value = True
         self.assertTrue(self.runner.test_connection())
-        self.mock_client.list_objects.assert_called_once_with("test")
+        self.mock_client.bucket_exists.assert_called_once_with("mock_bucket")
+        self.mock_client.list_objects.assert_not_called()
+
+    def test_test_connection_missing_bucket(self):
+        # 버킷이 없으면 연결 테스트 실패
+        self.mock_client.bucket_exists.return_value = False
+        with self.assertRaises(Exception) as context:
+            self.runner.test_connection()
+
+        self.assertIn("mock_bucket", str(context.exception))
 
     def test_test_connection_failure(self):
-        # list_objects 호출 실패 시 테스트
-        self.mock_client.list_objects.side_effect = Exception("Failed to connect")
+        # bucket_exists 호출 실패 시 테스트
+        self.mock_client.bucket_exists.side_effect = Exception("Failed to connect")
         with self.assertRaises(Exception) as context:
             self.runner.test_connection()
 
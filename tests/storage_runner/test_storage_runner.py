@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+import mock
+import orjson
+
+from redash.storage_runner import _storage_runners, loads_query, register_storage, storage_runners
+
+
+class TestLoadsQuery(TestCase):
+    def test_uses_orjson(self):
+        with mock.patch("redash.storage_runner.orjson.loads", wraps=orjson.loads) as loads:
+            self.assertEqual(loads_query('{"bucket": "test"}'), {"bucket": "test"})
+        loads.assert_called_once_with('{"bucket": "test"}')
+
+    def test_without_orjson(self):
+        # orjson이 설치되지 않은 경우 json_loads로 파싱
+        with mock.patch("redash.storage_runner.orjson", None):
+            self.assertEqual(loads_query('{"bucket": "test"}'), {"bucket": "test"})
+
+    def test_falls_back_on_input_rejected_by_orjson(self):
+        # orjson은 NaN을 허용하지 않으므로 json_loads로 다시 파싱
+        with self.assertRaises(orjson.JSONDecodeError):
+            orjson.loads('{"limit": NaN}')
+
+        result = loads_query('{"bucket": "test", "limit": NaN}')
+
+        self.assertEqual(result["bucket"], "test")
+        self.assertNotEqual(result["limit"], result["limit"])
+
+    def test_invalid_json(self):
+        with self.assertRaises(ValueError):
+            loads_query("{bucket")
+
+
+class TestRegisterStorage(TestCase):
+    def test_registered_runner_is_visible_through_imported_view(self):
+        runner_class = mock.Mock(TYPE="dummy", NAME="Dummy")
+        runner_class.enabled.return_value = True
+
+        with mock.patch.dict(_storage_runners):
+            register_storage(runner_class)
+            self.assertIs(storage_runners["dummy"], runner_class)
+
+        self.assertNotIn("dummy", storage_runners)
+
+    def test_disabled_runner_is_not_registered(self):
+        runner_class = mock.Mock(TYPE="dummy", NAME="Dummy")
+        runner_class.enabled.return_value = False
+
+        register_storage(runner_class)
+
+        self.assertNotIn("dummy", storage_runners)
+
+    def test_view_is_read_only(self):
+        with self.assertRaises(TypeError):
+            storage_runners["dummy"] = object()
@@ -1,15 +1,22 @@
+import uuid
+
+import redis
 from mock import Mock, patch
 from rq import Connection
 from rq.exceptions import NoSuchJobError
 
-from redash import models, rq_redis_connection
+from redash import models, redis_connection, rq_redis_connection, settings
 from redash.query_runner.pg import PostgreSQL
-from redash.tasks import Job
+from redash.tasks import Job, Queue
 from redash.tasks.queries.execution import (
+    INLINE_RESULT_TTL,
     QueryExecutionError,
+    _job_lock_id,
     enqueue_query,
     execute_query,
+    inline_result_key,
 )
+from redash.utils import gen_query_hash, json_loads
 from tests import BaseTestCase
 
 
@@ -140,6 +147,40 @@ class TestEnqueueTask(BaseTestCase):
         _, kwargs = enqueue.call_args
         self.assertEqual(60, kwargs.get("job_timeout"))
 
+    @patch("redash.tasks.queries.execution.SHARED_REDIS", True)
+    def test_enqueues_in_lock_transaction_on_shared_redis(self, enqueue, _):
+        query = self.factory.create_query()
+
+        with Connection(rq_redis_connection):
+            enqueue_query(
+                query.query_text,
+                query.data_source,
+                query.user_id,
+                False,
+                None,
+                {"Username": "Arik", "query_id": query.id},
+            )
+
+        _, kwargs = enqueue.call_args
+        self.assertIsNotNone(kwargs.get("pipeline"))
+
+    @patch("redash.tasks.queries.execution.SHARED_REDIS", False)
+    def test_enqueues_without_lock_transaction_on_separate_redis(self, enqueue, _):
+        query = self.factory.create_query()
+
+        with Connection(rq_redis_connection):
+            enqueue_query(
+                query.query_text,
+                query.data_source,
+                query.user_id,
+                False,
+                None,
+                {"Username": "Arik", "query_id": query.id},
+            )
+
+        _, kwargs = enqueue.call_args
+        self.assertNotIn("pipeline", kwargs)
+
     def test_multiple_enqueue_of_different_query(self, enqueue, _):
         query = self.factory.create_query()
 
@@ -172,6 +213,45 @@ class TestEnqueueTask(BaseTestCase):
         self.assertEqual(3, enqueue.call_count)
 
 
+@patch("redash.tasks.queries.execution.SHARED_REDIS", True)
+class TestEnqueueTaskSharedRedis(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Redash and RQ share one Redis server; the lock connection decodes responses like redash.redis_connection.
+        self.shared_redis = redis.from_url(settings.RQ_REDIS_URL, decode_responses=True)
+        patcher = patch("redash.tasks.queries.execution.redis_connection", self.shared_redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        rq_redis_connection.flushdb()
+        super().tearDown()
+
+    def test_concurrent_lock_change_discards_job(self):
+        query = self.factory.create_query()
+        lock_id = _job_lock_id(gen_query_hash(query.query_text), query.data_source.id)
+        enqueued = []
+        real_enqueue = Queue.enqueue
+
+        def enqueue_and_race(queue, *args, **kwargs):
+            job = real_enqueue(queue, *args, **kwargs)
+            if not enqueued:
+                # Another process takes the lock between WATCH and EXEC.
+                self.shared_redis.set(lock_id, "concurrent-job-id")
+            enqueued.append(job.id)
+            return job
+
+        with patch.object(Queue, "enqueue", autospec=True, side_effect=enqueue_and_race):
+            with Connection(rq_redis_connection):
+                job = enqueue_query(query.query_text, query.data_source, query.user_id, False, None, {})
+
+        queue = Queue(query.data_source.queue_name, connection=rq_redis_connection)
+        self.assertGreater(len(enqueued), 1)
+        self.assertEqual([job.id], queue.job_ids)
+        self.assertFalse(Job.exists(enqueued[0], connection=rq_redis_connection))
+        self.assertEqual(job.id, self.shared_redis.get(lock_id))
+
+
 @patch("redash.tasks.queries.execution.get_current_job", side_effect=fetch_job)
 class QueryExecutorTests(BaseTestCase):
     def test_success(self, _):
@@ -186,6 +266,72 @@ class QueryExecutorTests(BaseTestCase):
             result = models.QueryResult.query.get(result_id)
             self.assertEqual(result.data, query_result_data)
 
+    def test_success_without_job(self, _):
+        """
+        ``execute_query`` can run inline, outside of an RQ worker.
+        """
+        with patch("redash.tasks.queries.execution.get_current_job", return_value=None):
+            with patch.object(PostgreSQL, "run_query") as qr:
+                query_result_data = {"columns": [], "rows": []}
+                qr.return_value = (query_result_data, None)
+                result_id = execute_query("SELECT 1, 2", self.factory.data_source.id, {})
+
+        result = models.QueryResult.query.get(result_id)
+        self.assertEqual(result.data, query_result_data)
+
+    def test_without_job_keeps_enqueued_job_lock(self, _):
+        """
+        An inline run does not release the query_hash lock held by an enqueued job.
+        """
+        data_source = self.factory.data_source
+        lock_id = _job_lock_id(gen_query_hash("SELECT 1, 2"), data_source.id)
+        redis_connection.set(lock_id, "queued-job-id")
+
+        with patch("redash.tasks.queries.execution.get_current_job", return_value=None):
+            with patch.object(PostgreSQL, "run_query") as qr:
+                qr.return_value = ({"columns": [], "rows": []}, None)
+                execute_query("SELECT 1, 2", data_source.id, {})
+
+        self.assertEqual("queued-job-id", redis_connection.get(lock_id))
+
+    def test_success_inline_result(self, _):
+        """
+        Jobs enqueued with ``inline_result`` store small result rows under a short-lived key.
+        """
+        job = Mock(id=str(uuid.uuid4()), meta={"inline_result": True}, connection=rq_redis_connection)
+        key = inline_result_key(job.id)
+        with patch("redash.tasks.queries.execution.get_current_job", return_value=job):
+            with patch.object(PostgreSQL, "run_query") as qr:
+                qr.return_value = ({"columns": [], "rows": [{"a": 1}]}, None)
+                execute_query("SELECT 1", self.factory.data_source.id, {})
+
+        self.assertEqual(json_loads(rq_redis_connection.get(key)), [{"a": 1}])
+        self.assertTrue(0 < rq_redis_connection.ttl(key) <= INLINE_RESULT_TTL)
+        # rows are not copied into job.meta, which lives as long as the job itself
+        self.assertNotIn("rows", job.meta)
+        job.save_meta.assert_not_called()
+        rq_redis_connection.delete(key)
+
+    def test_success_inline_result_too_large(self, _):
+        job = Mock(id=str(uuid.uuid4()), meta={"inline_result": True}, connection=rq_redis_connection)
+        with patch("redash.tasks.queries.execution.get_current_job", return_value=job):
+            with patch("redash.tasks.queries.execution.INLINE_RESULT_MAX_SIZE", 1):
+                with patch.object(PostgreSQL, "run_query") as qr:
+                    qr.return_value = ({"columns": [], "rows": [{"a": 1}]}, None)
+                    execute_query("SELECT 1", self.factory.data_source.id, {})
+
+        self.assertIsNone(rq_redis_connection.get(inline_result_key(job.id)))
+
+    def test_success_inline_result_empty_data(self, _):
+        job = Mock(id=str(uuid.uuid4()), meta={"inline_result": True}, connection=rq_redis_connection)
+        with patch("redash.tasks.queries.execution.get_current_job", return_value=job):
+            with patch.object(PostgreSQL, "run_query") as qr:
+                qr.return_value = ({}, None)
+                result_id = execute_query("SELECT 1", self.factory.data_source.id, {})
+
+        self.assertEqual(models.QueryResult.query.get(result_id).data, {})
+        self.assertIsNone(rq_redis_connection.get(inline_result_key(job.id)))
+
     def test_success_scheduled(self, _):
         """
         Scheduled queries remember their latest results.